@@ -1,16 +1,29 @@
 from __future__ import annotations
-import os, re, json, time
+import os, re, time, asyncio, hashlib, random, types
+from functools import lru_cache
+from pathlib import Path
 from typing import Dict, Any, List, Tuple
 
 
 from dotenv import load_dotenv  # type: ignore
 load_dotenv(override=False)
 
-from openai import OpenAI
+import orjson
+import tiktoken
+from openai import AsyncOpenAI, RateLimitError
 
 # Initialize client from environment variables (OPENAI_API_KEY, etc.).
 # Do NOT pass api_key explicitly: we honor your existing environment/.env setup.
-client = OpenAI()
+# The async client's connection pool is tied to the event loop that first used it,
+# so we keep one client per running loop (each asyncio.run() gets a fresh one).
+_client: Tuple[asyncio.AbstractEventLoop, AsyncOpenAI] | None = None
+
+def get_client() -> AsyncOpenAI:
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client[0] is not loop:
+        _client = (loop, AsyncOpenAI())
+    return _client[1]
 
 PAGE_BREAK = "\n\n----- PAGE BREAK -----\n\n"
 
@@ -42,16 +55,22 @@ def _normalize_temperature(model: str, temperature: float | None) -> float:
 
 # ---------------- helpers ----------------
 _REF_HEAD_RE = re.compile(r'^\s*(references|bibliography|literature)\b', re.I | re.M)
+_MULTI_NL_RE = re.compile(r"\n{3,}")
 
-def _truncate_by_reference_heading(text: str) -> str:
-    pages = text.split(PAGE_BREAK)
+def truncate_pages_at_references(pages: List[str]) -> List[str]:
+    """Drop the first page with a References/Bibliography/Literature heading and everything after it."""
     for i, p in enumerate(pages):
         if _REF_HEAD_RE.search(p):
-            return PAGE_BREAK.join(pages[:i]).rstrip()
-    return text
+            return pages[:i]
+    return pages
+
+def _truncate_by_reference_heading(text: str) -> str:
+    pages = text.split(PAGE_BREAK)
+    kept = truncate_pages_at_references(pages)
+    return text if kept is pages else PAGE_BREAK.join(kept).rstrip()
 
 def clean_text(text: str, drop_refs_after_page:int|None=None, cut_at_references:bool=True) -> str:
-    s = re.sub(r"\n{3,}", "\n\n", text).strip()
+    s = _MULTI_NL_RE.sub("\n\n", text).strip()
     if cut_at_references:
         s = _truncate_by_reference_heading(s)
     if drop_refs_after_page is not None:
@@ -73,12 +92,19 @@ def is_size_signal_error(exc: Exception) -> bool:
     msg = str(exc).lower()
     return any(t in msg for t in ["context length", "maximum context", "too many tokens", "input is too long"])
 
+def _field(obj, name: str):
+    # Usage comes as SDK objects (live calls) or plain dicts (Batch API output files).
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
 def _usage_dict(resp) -> Dict[str,int]:
     u = getattr(resp, "usage", None) or {}
+    d = _field(u, "prompt_tokens_details") or {}
     return {
-        "prompt_tokens": int(getattr(u, "prompt_tokens", 0) or u.get("prompt_tokens", 0) or 0),
-        "completion_tokens": int(getattr(u, "completion_tokens", 0) or u.get("completion_tokens", 0) or 0),
-        "total_tokens": int(getattr(u, "total_tokens", 0) or u.get("total_tokens", 0) or 0),
+        "prompt_tokens": int(_field(u, "prompt_tokens") or 0),
+        "completion_tokens": int(_field(u, "completion_tokens") or 0),
+        "total_tokens": int(_field(u, "total_tokens") or 0),
+        # Prompt tokens served from OpenAI's automatic prefix cache (requests >= 1024 tokens).
+        "cached_tokens": int(_field(d, "cached_tokens") or 0),
     }
 
 def add_usage(a: Dict[str,int], b: Dict[str,int]) -> Dict[str,int]:
@@ -86,78 +112,270 @@ def add_usage(a: Dict[str,int], b: Dict[str,int]) -> Dict[str,int]:
         "prompt_tokens": a.get("prompt_tokens",0) + b.get("prompt_tokens",0),
         "completion_tokens": a.get("completion_tokens",0) + b.get("completion_tokens",0),
         "total_tokens": a.get("total_tokens",0) + b.get("total_tokens",0),
+        "cached_tokens": a.get("cached_tokens",0) + b.get("cached_tokens",0),
+    }
+
+def log_cache_ratio(tag: str, usage: Dict[str,int]) -> None:
+    """Print, once per phase, how many prompt tokens OpenAI served from its prompt cache."""
+    prompt = usage.get("prompt_tokens", 0)
+    if prompt:
+        cached = usage.get("cached_tokens", 0)
+        print(f"[{tag}] prompt cache {cached}/{prompt} tokens ({100 * cached // prompt}%)")
+
+# ---------------- token counting / rate limiting ----------------
+@lru_cache(maxsize=None)
+def _enc(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Model names tiktoken doesn't know yet: use the current default encoding.
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads its encoding files on first use; if that fails (offline,
+        # blocked host) the counts are only estimates anyway, so fall back to chars/4.
+        log_error(f"tiktoken({model}); estimating tokens as chars/4", e)
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    enc = _enc(model)
+    if enc is None:
+        return len(text) // 4
+    # PDFs occasionally contain literal special-token strings; count them as plain text.
+    return len(enc.encode(text, disallowed_special=()))
+
+# Max prompt (input) tokens per model family; longest matching prefix wins, unknown models assume 128k.
+_MODEL_CTX: Dict[str,int] = {
+    "gpt-5": 272000,
+    "gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "o3": 200000,
+    "o4-mini": 200000,
+}
+
+def _single_pass_limit(cfg: Dict[str,Any]) -> int:
+    if cfg.get("single_pass_max_tokens"):
+        return int(cfg["single_pass_max_tokens"])
+    model = (cfg["model"] or "").lower()
+    ctx = next((v for k, v in sorted(_MODEL_CTX.items(), key=lambda kv: -len(kv[0])) if model.startswith(k)), 128000)
+    # Leave room for the prompt template and the reply.
+    return ctx - cfg.get("reserve", 4096)
+
+class RateLimiter:
+    """
+    Token buckets for requests/min and tokens/min, refilled continuously.
+    acquire() waits until both buckets can cover the next request, so we stay
+    under the account limits instead of discovering them through 429s.
+    """
+    def __init__(self, max_requests_per_minute: float, max_tokens_per_minute: float):
+        self.max_requests_per_minute = float(max_requests_per_minute)
+        self.max_tokens_per_minute = float(max_tokens_per_minute)
+        self.capacity_available_request = self.max_requests_per_minute
+        self.capacity_available_token = self.max_tokens_per_minute
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        dt, self._last_refill = now - self._last_refill, now
+        self.capacity_available_request = min(
+            self.max_requests_per_minute,
+            self.capacity_available_request + self.max_requests_per_minute * dt / 60.0,
+        )
+        self.capacity_available_token = min(
+            self.max_tokens_per_minute,
+            self.capacity_available_token + self.max_tokens_per_minute * dt / 60.0,
+        )
+
+    async def acquire(self, tokens: int) -> None:
+        # A request bigger than the whole minute budget would never fit; let it through once the bucket is full.
+        tokens = min(float(tokens), self.max_tokens_per_minute)
+        while True:
+            self._refill()
+            paused = self._paused_until - time.monotonic()
+            if paused <= 0 and self.capacity_available_request >= 1 and self.capacity_available_token >= tokens:
+                self.capacity_available_request -= 1
+                self.capacity_available_token -= tokens
+                return
+            wait_req = (1 - self.capacity_available_request) * 60.0 / self.max_requests_per_minute
+            wait_tok = (tokens - self.capacity_available_token) * 60.0 / self.max_tokens_per_minute
+            await asyncio.sleep(max(paused, wait_req, wait_tok, 0.05))
+
+    def back_off(self, seconds: float) -> None:
+        """The server rejected us anyway (429): drain both buckets and hold new requests for `seconds`."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.capacity_available_request = 0.0
+        self.capacity_available_token = 0.0
+
+_limiters: Dict[str, RateLimiter] = {}
+
+# One cap on in-flight API calls shared by everything running on the loop (all papers,
+# recursive halves, reduces), so fan-out inside a paper cannot exceed it.
+_inflight: Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+
+def _inflight_slots(cfg: Dict[str,Any]) -> asyncio.Semaphore:
+    global _inflight
+    loop = asyncio.get_running_loop()
+    if _inflight is None or _inflight[0] is not loop:
+        _inflight = (loop, asyncio.Semaphore(cfg.get("num_concurrent", 8)))
+    return _inflight[1]
+
+def _get_limiter(model: str, cfg: Dict[str,Any]) -> RateLimiter | None:
+    # Limits are per model on the OpenAI side, so both phases share a bucket when they use the same model.
+    rpm, tpm = cfg.get("max_requests_per_minute"), cfg.get("max_tokens_per_minute")
+    if not rpm or not tpm:
+        return None
+    if model not in _limiters:
+        _limiters[model] = RateLimiter(rpm, tpm)
+    return _limiters[model]
+
+def _retry_after(exc: Exception) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+# ---------------- response cache ----------------
+# Identical (model, temperature, system, user) calls are answered from disk, so
+# re-running after a prompt tweak only pays for the requests that changed.
+_CACHE_DIR = Path(os.getenv("SUMMARIZER_CACHE", ".llm_cache"))
+
+def _cache_path(model: str, temperature: float, system_prompt: str, user_prompt: str) -> Path:
+    key = hashlib.blake2b(
+        f"{model}|{temperature}|{system_prompt}|{user_prompt}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+    return _CACHE_DIR / key[:2] / f"{key}.json"
+
+def _cache_read(path: Path) -> Dict[str,Any] | None:
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+def _cache_write(path: Path, entry: Dict[str,Any]) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(orjson.dumps(entry))
+        tmp.replace(path)  # atomic, so concurrent tasks never see half-written entries
+    except OSError as e:
+        log_error("cache write", e)
+
+def _chat_body(model:str, system_prompt:str, user_prompt:str, temperature:float) -> Dict[str,Any]:
+    # Shared by live calls and Batch API request lines so both send the exact same request.
+    return {
+        "model": model,
+        "response_format": {"type":"json_object"},
+        "temperature": temperature,
+        "messages": [{"role":"system","content":system_prompt},{"role":"user","content":user_prompt}],
     }
 
+def _sleep_for(attempt: int, exc: Exception) -> float:
+    """Retry delay: the server's Retry-After when given, else jittered exponential backoff (long for 429s, short otherwise)."""
+    retry_after = _retry_after(exc)
+    if retry_after is not None:
+        return retry_after
+    base = 8.0 if isinstance(exc, RateLimitError) or "rate limit" in str(exc).lower() else 0.3
+    return base * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
 # Keep cfg param for compatibility, but we ignore it for client creation (env-only).
-def call_chat_json(model:str, system_prompt:str, user_prompt:str, temperature:float, cfg:Dict[str,Any]) -> Tuple[Dict[str,Any], str, Dict[str,int]]:
+async def acall_chat_json(model:str, system_prompt:str, user_prompt:str, temperature:float, cfg:Dict[str,Any]) -> Tuple[Dict[str,Any], str, Dict[str,int]]:
     # Normalize temperature for models that reject 0
     temperature = _normalize_temperature(model, temperature)
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            response_format={"type":"json_object"},
-            temperature=temperature,
-            messages=[{"role":"system","content":system_prompt},{"role":"user","content":user_prompt}],
-        )
-    except Exception as e:
-        # Surface the real API error and re-raise for upstream handling.
-        log_error("call_chat_json", e)
-        raise
+    cache_path = _cache_path(model, temperature, system_prompt, user_prompt) if cfg.get("use_cache", True) else None
+    if cache_path is not None:
+        hit = _cache_read(cache_path)
+        if hit is not None:
+            log_info(f"cache hit {cache_path.name}")
+            return hit["json"], hit["finish"], {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+    limiter = _get_limiter(model, cfg)
+    async with _inflight_slots(cfg):
+        if limiter is not None:
+            await limiter.acquire(count_tokens(system_prompt + user_prompt, model))
+        try:
+            resp = await get_client().chat.completions.create(
+                **_chat_body(model, system_prompt, user_prompt, temperature)
+            )
+        except Exception as e:
+            # Surface the real API error and re-raise for upstream handling.
+            log_error("acall_chat_json", e)
+            if limiter is not None and isinstance(e, RateLimitError):
+                limiter.back_off(_retry_after(e) or 1.0)
+            raise
 
     content = resp.choices[0].message.content or "{}"
     finish = resp.choices[0].finish_reason or ""
     usage = _usage_dict(resp)
-    return json.loads(content), finish, usage
+    j = orjson.loads(content)
+    if cache_path is not None:
+        _cache_write(cache_path, {"json": j, "finish": finish, "usage": usage})
+    return j, finish, usage
 
-def split_in_two(text:str, overlap:int) -> Tuple[str,str]:
-    n = len(text); mid = n//2
-    return text[:max(0, mid + overlap//2)].strip(), text[max(0, mid - overlap//2):].strip()
+def split_in_two_tokens(text:str, overlap:int, model:str) -> Tuple[str,str]:
+    # Split on the token midpoint (overlap is in tokens too): dense math/figure text
+    # can be far more tokens per character than prose, so character halves are uneven.
+    enc = _enc(model)
+    if enc is None:  # no encoder available: split on characters (~4 per token)
+        mid, ov = len(text)//2, overlap*2
+        return text[:mid + ov].strip(), text[max(0, mid - ov):].strip()
+    ids = enc.encode(text, disallowed_special=())
+    n = len(ids); mid = n//2
+    return enc.decode(ids[:max(0, mid + overlap//2)]).strip(), enc.decode(ids[max(0, mid - overlap//2):]).strip()
 
 # --------------- core ops (prompts come from cfg["prompts"]) ---------------
-def try_single_pass(text:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str]|None, str, Dict[str,int]]:
+async def atry_single_pass(text:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str]|None, str, Dict[str,int]]:
     sys = cfg["prompts"]["system"]
     usr = cfg["prompts"]["single"].format(context=context, text=text)
     try:
-        j, finish, u = call_chat_json(cfg["model"], sys, usr, cfg["temperature"], cfg)
+        j, finish, u = await acall_chat_json(cfg["model"], sys, usr, cfg["temperature"], cfg)
         if finish == "length":
             return None, "finish_length", u
         return ensure_schema(j, cfg["schema_keys"]), "ok", u
     except Exception as e:
         # Log the actual exception
-        log_error("try_single_pass", e)
+        log_error("atry_single_pass", e)
         if is_size_signal_error(e):
             return None, "too_big", {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
         # Keep previous behavior but include type in status
         return None, f"error:{e.__class__.__name__}", {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
 
-def summarize_chunk(chunk:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
+async def asummarize_chunk(chunk:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
     sys = cfg["prompts"]["system"]
     usr = cfg["prompts"]["map"].format(context=context, chunk=chunk)
     tries, usage = 0, {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
     while True:
         tries += 1
         try:
-            j, _, u = call_chat_json(cfg["model"], sys, usr, cfg["temperature"], cfg)
+            j, _, u = await acall_chat_json(cfg["model"], sys, usr, cfg["temperature"], cfg)
             usage = add_usage(usage, u)
             return ensure_schema(j, cfg["schema_keys"]), usage
         except Exception as e:
-            log_error("summarize_chunk", e)
+            log_error("asummarize_chunk", e)
             if is_size_signal_error(e): raise
             if tries >= 2: raise
-            time.sleep(0.6)
+            await asyncio.sleep(_sleep_for(tries, e))
+
+def _format_partials(parts:List[Dict[str,str]], keys:List[str]) -> str:
+    # Plain "key: value" blocks separated by "---": same content as JSON, fewer prompt tokens.
+    return "\n---\n".join("\n".join(f"{k}: {p.get(k, '')}" for k in keys) for p in parts)
 
-def reduce_partials(parts:List[Dict[str,str]], context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
+async def areduce_partials(parts:List[Dict[str,str]], context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
     sys = cfg["prompts"]["system"]
-    usr = cfg["prompts"]["reduce"].format(context=context, partials=json.dumps(parts, ensure_ascii=False))
+    usr = cfg["prompts"]["reduce"].format(context=context, partials=_format_partials(parts, cfg["schema_keys"]))
     tries, usage = 0, {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
     while True:
         tries += 1
         try:
-            j, _, u = call_chat_json(cfg["model"], sys, usr, cfg["temperature"], cfg)
+            j, _, u = await acall_chat_json(cfg["model"], sys, usr, cfg["temperature"], cfg)
             usage = add_usage(usage, u)
             return ensure_schema(j, cfg["schema_keys"]), usage
         except Exception as e:
-            log_error("reduce_partials", e)
+            log_error("areduce_partials", e)
             if tries >= 2:
                 # Fall back to simple merge
                 merged = {}
@@ -169,46 +387,238 @@ def reduce_partials(parts:List[Dict[str,str]], context:str, cfg:Dict[str,Any]) -
                             val = v; break
                     merged[k] = val
                 return merged, usage
-            time.sleep(0.8)
+            await asyncio.sleep(_sleep_for(tries, e))
+
+async def aembed_texts(texts:List[str], cfg:Dict[str,Any], batch:int=100) -> Tuple[List[List[float]], Dict[str,int]]:
+    """Embed texts with cfg["embedding_model"], `batch` inputs per request, preserving order."""
+    model = cfg.get("embedding_model", "text-embedding-3-small")
+    async def one(chunk: List[str]):
+        async with _inflight_slots(cfg):
+            return await get_client().embeddings.create(model=model, input=chunk)
+    resps = await asyncio.gather(*(one(texts[k:k + batch]) for k in range(0, len(texts), batch)))
+    vectors: List[List[float]] = []
+    usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+    for r in resps:
+        vectors.extend(d.embedding for d in sorted(r.data, key=lambda d: d.index))
+        usage = add_usage(usage, _usage_dict(r))
+    return vectors, usage
+
+def fits_single_pass(text:str, cfg:Dict[str,Any]) -> bool:
+    return count_tokens(text, cfg["model"]) <= _single_pass_limit(cfg)
 
-def recursive_binary_map(text:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
+async def areduce_tree(parts:List[Dict[str,str]], context:str, cfg:Dict[str,Any], fan_in:int=8) -> Tuple[Dict[str,str], Dict[str,int]]:
+    """Merge many partials by reducing fan_in at a time, level by level, until one is left."""
+    usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+    async def reduce_group(group: List[Dict[str,str]]) -> Tuple[Dict[str,str], Dict[str,int]]:
+        if len(group) == 1:  # a leftover single partial moves up a level as-is
+            return group[0], {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+        return await areduce_partials(group, context, cfg)
+    while len(parts) > 1:
+        merged = await asyncio.gather(*(
+            reduce_group(parts[k:k + fan_in]) for k in range(0, len(parts), fan_in)
+        ))
+        parts = [m for m, _ in merged]
+        for _, u in merged:
+            usage = add_usage(usage, u)
+    return parts[0], usage
+
+async def arecursive_binary_map(text:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
     try:
-        part, u = summarize_chunk(text, context, cfg)
+        part, u = await asummarize_chunk(text, context, cfg)
         return part, u
     except Exception as e:
         if is_size_signal_error(e):
-            L, R = split_in_two(text, cfg["binary_overlap"])
-            left, uL = recursive_binary_map(L, context, cfg)
-            right, uR = recursive_binary_map(R, context, cfg)
-            merged, uM = reduce_partials([left, right], context, cfg)
+            L, R = split_in_two_tokens(text, cfg["binary_overlap"], cfg["model"])
+            # Halves are independent; the shared in-flight cap keeps fan-out bounded.
+            (left, uL), (right, uR) = await asyncio.gather(
+                arecursive_binary_map(L, context, cfg),
+                arecursive_binary_map(R, context, cfg),
+            )
+            merged, uM = await areduce_partials([left, right], context, cfg)
             return merged, add_usage(add_usage(uL, uR), uM)
         # Non-size errors bubble up to caller after being logged upstream
         raise
 
-def chunked_map_reduce(text:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
-    return recursive_binary_map(text, context, cfg)
+async def achunked_map_reduce(text:str, context:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,str], Dict[str,int]]:
+    return await arecursive_binary_map(text, context, cfg)
 
-def summarize_text(text:str, context:str, mode:str, cfg:Dict[str,Any]) -> Tuple[str, Dict[str,str]|None, Dict[str,int]]:
+async def asummarize_text(text:str, context:str, mode:str, cfg:Dict[str,Any]) -> Tuple[str, Dict[str,str]|None, Dict[str,int]]:
     cleaned = clean_text(
         text,
         cfg.get("drop_refs_after_page"),
         cfg.get("cut_at_references", True),
     )
     if mode == "never":
-        s, _, u = try_single_pass(cleaned, context, cfg)
+        s, _, u = await atry_single_pass(cleaned, context, cfg)
         return ("single", s, u) if s else ("single", None, u)
     if mode == "always":
         try:
-            s, u = chunked_map_reduce(cleaned, context, cfg)
+            s, u = await achunked_map_reduce(cleaned, context, cfg)
             return "chunked", s, u
         except Exception as e:
-            log_error("summarize_text(always)", e)
+            log_error("asummarize_text(always)", e)
             return "chunked", None, {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
-    s, _, u1 = try_single_pass(cleaned, context, cfg)
+    # Skip the single-pass probe when the text cannot fit the model's context; it would only fail.
+    n, limit = count_tokens(cleaned, cfg["model"]), _single_pass_limit(cfg)
+    if n > limit:
+        log_info(f"text is {n} tokens (> {limit}); going straight to chunked")
+        s, _, u1 = None, "too_big", {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+    else:
+        s, _, u1 = await atry_single_pass(cleaned, context, cfg)
     if s: return "single", s, u1
     try:
-        s2, u2 = chunked_map_reduce(cleaned, context, cfg)
+        s2, u2 = await achunked_map_reduce(cleaned, context, cfg)
         return "chunked", s2, add_usage(u1, u2)
     except Exception as e:
-        log_error("summarize_text(auto->chunked)", e)
+        log_error("asummarize_text(auto->chunked)", e)
         return "chunked", None, u1
+
+async def asummarize_many(named_texts:List[Tuple[str,str]], cfg:Dict[str,Any]) -> Tuple[Dict[str,Dict[str,str]], Dict[str,int]]:
+    """
+    Summarize several (small) papers in ONE request to save on requests-per-minute.
+    Returns the summaries the model produced, keyed by file name; anything missing
+    (truncated reply, too-big request, dropped paper) is left for the caller to retry
+    alone. Other errors (429s, 5xx) are retried as one packed request first, so they
+    do not turn into K single requests with no backoff.
+    """
+    sys = cfg["prompts"]["system"] + "\n\n" + cfg["prompts"]["pack"]
+    usr = "\n\n".join(
+        f"[[FILE={name}]]\n" + clean_text(text, cfg.get("drop_refs_after_page"), cfg.get("cut_at_references", True))
+        for name, text in named_texts
+    )
+    tries = 0
+    while True:
+        tries += 1
+        try:
+            j, finish, u = await acall_chat_json(cfg["model"], sys, usr, cfg["temperature"], cfg)
+            break
+        except Exception as e:
+            log_error("asummarize_many", e)
+            if is_size_signal_error(e) or tries >= 3:
+                return {}, {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+            await asyncio.sleep(_sleep_for(tries, e))
+    if finish == "length":
+        return {}, u
+    names = {name for name, _ in named_texts}
+    out: Dict[str,Dict[str,str]] = {}
+    for entry in j.get("papers") or []:
+        if isinstance(entry, dict) and entry.get("file") in names and isinstance(entry.get("summary"), dict):
+            out[entry["file"]] = ensure_schema(entry["summary"], cfg["schema_keys"])
+    return out, u
+
+# --------------- OpenAI Batch API (offline runs, half price, 24h window) ---------------
+_BATCH_DONE = ("completed", "failed", "expired", "cancelled")
+
+# Consecutive failures tolerated while talking to a running batch, and the longest wait between them.
+_BATCH_RETRIES = 10
+_BATCH_MAX_SLEEP = 300.0
+
+def _batch_request(text:str, cfg:Dict[str,Any]) -> Tuple[Dict[str,Any], Path|None]:
+    """The single-pass request body for one paper, plus its response-cache path (None when caching is off)."""
+    temperature = _normalize_temperature(cfg["model"], cfg["temperature"])
+    sys = cfg["prompts"]["system"]
+    cleaned = clean_text(text, cfg.get("drop_refs_after_page"), cfg.get("cut_at_references", True))
+    usr = cfg["prompts"]["single"].format(context="", text=cleaned)
+    cache_path = _cache_path(cfg["model"], temperature, sys, usr) if cfg.get("use_cache", True) else None
+    return _chat_body(cfg["model"], sys, usr, temperature), cache_path
+
+async def _batch_call(what:str, batch_id:str, call):
+    # A batch can run for 24h; a transient error while we wait must not orphan the paid job.
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            attempt += 1
+            log_error(f"{what}({batch_id})", e)
+            if attempt >= _BATCH_RETRIES:
+                print(f"[ENGINE] giving up on batch {batch_id}; it keeps running on OpenAI's side. "
+                      f"Set phase1 cfg['batch_id'] = '{batch_id}' to resume it.")
+                raise
+            await asyncio.sleep(min(_sleep_for(attempt, e), _BATCH_MAX_SLEEP))
+
+async def asubmit_batch(items:List[Tuple[str,str]], cfg:Dict[str,Any]) -> Tuple[str|None, Dict[str, Tuple[Dict[str,str]|None, str, Dict[str,int]]]]:
+    """
+    Upload one single-pass request per (custom_id, text) as a JSONL file and start
+    a batch on /v1/chat/completions. Requests already in the response cache are not
+    sent; they come back as {custom_id: (summary | None, status, usage)}.
+    Returns (batch id for await_batch(), or None if everything was cached; cache hits).
+    """
+    hits: Dict[str, Tuple[Dict[str,str]|None, str, Dict[str,int]]] = {}
+    lines = []
+    for custom_id, text in items:
+        body, cache_path = _batch_request(text, cfg)
+        hit = _cache_read(cache_path) if cache_path is not None else None
+        if hit is not None:
+            log_info(f"cache hit {cache_path.name}")
+            no_usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+            if hit["finish"] == "length":
+                hits[custom_id] = (None, "finish_length", no_usage)
+            else:
+                hits[custom_id] = (ensure_schema(hit["json"], cfg["schema_keys"]), "ok", no_usage)
+            continue
+        lines.append(orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body,
+        }, option=orjson.OPT_APPEND_NEWLINE))
+    if not lines:
+        log_info(f"all {len(items)} batch requests served from cache")
+        return None, hits
+    client = get_client()
+    f = await client.files.create(file=("batch_input.jsonl", b"".join(lines)), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=f.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    # Always shown: the id is the only handle for resuming the job if this run dies.
+    print(f"[ENGINE] batch {batch.id} submitted with {len(lines)} requests "
+          f"({len(hits)} cached); resume with phase1 cfg['batch_id'] = '{batch.id}'")
+    return batch.id, hits
+
+async def await_batch(batch_id:str, items:List[Tuple[str,str]], cfg:Dict[str,Any]) -> Dict[str, Tuple[Dict[str,str]|None, str, Dict[str,int]]]:
+    """
+    Poll a batch until it reaches a final state and parse its output file.
+    `items` are the (custom_id, text) pairs the batch was built from; successful
+    rows are written to the response cache under the same key a live call would use.
+    Returns {custom_id: (summary | None, status, usage)}; requests that errored or
+    never ran are simply absent, so callers can retry them through the live API.
+    """
+    client = get_client()
+    while True:
+        b = await _batch_call("await_batch", batch_id, lambda: client.batches.retrieve(batch_id))
+        if b.status in _BATCH_DONE:
+            break
+        counts = b.request_counts
+        log_info(f"batch {batch_id}: {b.status} ({counts.completed if counts else 0}/{counts.total if counts else '?'})")
+        await asyncio.sleep(cfg.get("batch_poll_seconds", 30))
+    log_info(f"batch {batch_id}: {b.status}")
+    out: Dict[str, Tuple[Dict[str,str]|None, str, Dict[str,int]]] = {}
+    if not b.output_file_id:
+        return out
+    content = await _batch_call("await_batch(output)", batch_id, lambda: client.files.content(b.output_file_id))
+    cache_paths = {custom_id: _batch_request(text, cfg)[1] for custom_id, text in items}
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        row = orjson.loads(line)
+        resp = row.get("response") or {}
+        body = resp.get("body") or {}
+        if resp.get("status_code") != 200 or not body.get("choices"):
+            continue
+        choice = body["choices"][0]
+        usage = _usage_dict(types.SimpleNamespace(usage=body.get("usage") or {}))
+        if (choice.get("finish_reason") or "") == "length":
+            out[row["custom_id"]] = (None, "finish_length", usage)
+            continue
+        try:
+            j = orjson.loads((choice.get("message") or {}).get("content") or "{}")
+        except ValueError as e:
+            log_error(f"await_batch({row['custom_id']})", e)
+            continue
+        if cache_paths.get(row["custom_id"]) is not None:
+            _cache_write(cache_paths[row["custom_id"]], {"json": j, "finish": choice.get("finish_reason") or "", "usage": usage})
+        out[row["custom_id"]] = (ensure_schema(j, cfg["schema_keys"]), "ok", usage)
+    return out
@@ -2,13 +2,33 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Dict, Any, List
 
-def write_metadata_header_md(path: Path, title: str, meta: Dict[str,Any]) -> None:
+def _metadata_header_md(title: str, meta: Dict[str,Any], width: int = 0) -> bytes:
     lines = [f"# {title}", ""]
     lines += ["| Metric | Value |","|---|---|"]
-    for k,v in meta.items(): lines.append(f"| {k} | {v} |")
+    for k,v in meta.items(): lines.append(f"| {k} | {str(v).ljust(width)} |")
     lines += ["", ""]
+    return "\n".join(lines).encode("utf-8")
+
+def write_metadata_header_md(path: Path, title: str, meta: Dict[str,Any], width: int = 0) -> int:
+    """Write the header (values padded to `width`) as the whole file; returns its size in bytes."""
+    header = _metadata_header_md(title, meta, width)
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text("\n".join(lines), encoding="utf-8")
+    path.write_bytes(header)
+    return len(header)
+
+def rewrite_metadata_header_md(path: Path, title: str, meta: Dict[str,Any], width: int, old_len: int) -> None:
+    """Replace the `old_len`-byte header written by write_metadata_header_md, keeping the body."""
+    header = _metadata_header_md(title, meta, width)
+    with path.open("r+b") as f:
+        if len(header) == old_len:
+            f.write(header)  # same size: overwrite in place
+            return
+        # A value outgrew `width`: rewrite the file behind the new header.
+        f.seek(old_len)
+        body = f.read()
+        f.seek(0)
+        f.write(header + body)
+        f.truncate()
 
 def format_summary_section(filename: str, summary: Dict[str,str], schema_keys: List[str]) -> str:
     label = {
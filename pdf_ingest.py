@@ -1,8 +1,22 @@
 from __future__ import annotations
 from typing import List, Dict, Tuple, Any
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import glob
+import hashlib
+import os
 import fitz  # PyMuPDF
+import orjson
+
+PAGE_BREAK = "\n\n----- PAGE BREAK -----\n\n"
+
+# Extracted pages are cached by a hash of the PDF bytes, so re-runs skip PyMuPDF
+# entirely and a changed file is simply a new cache entry. The key also carries the
+# PyMuPDF version, the extraction flags and _EXTRACT_VERSION (bump it whenever
+# _extract_pages changes), so a different extractor never serves stale text.
+_PDF_CACHE_DIR = Path(os.getenv("SUMMARIZER_PDF_CACHE", ".cache/pdf"))
+_EXTRACT_FLAGS = fitz.TEXT_PRESERVE_LIGATURES
+_EXTRACT_VERSION = 1
 
 # ---------- Core I/O ----------
 
@@ -18,31 +32,86 @@ class PDFReadError(Exception):
 #    except Exception as e:
 #        raise PDFReadError(f"Could not open PDF: {p}") from e
 
+def _extract_pages(data: bytes) -> List[str]:
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        pages = []
+        for page in doc:
+            try:
+                # Build the TextPage once and extract from it directly (what get_text("text")
+                # does internally, minus its per-call option dispatch).
+                tp = page.get_textpage(flags=_EXTRACT_FLAGS)
+                text = tp.extractText() or ""
+            except Exception:
+                text = ""  # keep pipeline flowing even if one page fails
+            pages.append(text.strip())
+        return pages
+
 def read_pdf_pages(path: str | Path) -> List[str]:
     p = Path(path)
     try:
-        with fitz.open(str(p)) as doc:
-            pages = []
-            for i in range(len(doc)):
-                try:
-                    text = doc[i].get_text("text", flags=fitz.TEXT_PRESERVE_LIGATURES) or ""
-                except Exception:
-                    text = ""  # keep pipeline flowing even if one page fails
-                pages.append(text.strip())
-            return pages
+        data = p.read_bytes()
+    except OSError as e:
+        raise PDFReadError(f"Could not open PDF: {p}") from e
+
+    key = f"{hashlib.sha1(data).hexdigest()}-{fitz.VersionBind}-{_EXTRACT_FLAGS}-v{_EXTRACT_VERSION}"
+    cache = _PDF_CACHE_DIR / f"{key}.json"
+    try:
+        return orjson.loads(cache.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        pass
+
+    try:
+        pages = _extract_pages(data)
     except Exception as e:
         raise PDFReadError(f"Could not open PDF: {p}") from e
 
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(orjson.dumps(pages))
+        tmp.replace(cache)  # atomic: parallel workers never read a partial entry
+    except OSError:
+        pass  # caching is best-effort
+    return pages
+
+
+def _ingest_one(path: str) -> Tuple[str, Dict[str, Any] | None, Dict[str, Any]]:
+    """Read one PDF; top-level so it can run in a worker process. Returns (name, corpus entry or None, stats row)."""
+    name = Path(path).name
+    try:
+        pages = read_pdf_pages(path)
+    except PDFReadError as e:
+        return name, None, {
+            "file": name,
+            "pages": 0,
+            "chars_total": 0,
+            "avg_chars_per_page": 0,
+            "status": "error",
+            "error": str(e)
+        }
+    # Length of the page-break-joined text, without materializing it.
+    chars_total = sum(map(len, pages)) + len(PAGE_BREAK) * max(0, len(pages) - 1)
+    return name, {"pages": pages, "page_count": len(pages)}, {
+        "file": name,
+        "pages": len(pages),
+        "chars_total": chars_total,
+        "avg_chars_per_page": int(chars_total / len(pages)) if pages else 0,
+        "status": "ok",
+        "error": ""
+    }
+
 
 # ---------- Public API ----------
 
-def load_corpus(pattern: str = "input/*.pdf") -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+def load_corpus(pattern: str = "input/*.pdf", max_workers: int | None = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     """
+    PDFs are parsed in parallel worker processes (text extraction is CPU-bound);
+    max_workers defaults to os.cpu_count().
+
     Returns:
       corpus: {
         "<filename>.pdf": {
           "pages": [str, ...],
-          "text": str,                 # pages joined with page breaks
           "page_count": int,
         },
         ...
@@ -52,30 +121,19 @@ def load_corpus(pattern: str = "input/*.pdf") -> Tuple[Dict[str, Any], List[Dict
     corpus: Dict[str, Any] = {}
     rows: List[Dict[str, Any]] = []
 
-    for path in sorted(glob.glob(pattern)):
-        name = Path(path).name
-        try:
-            pages = read_pdf_pages(path)
-            joined = "\n\n----- PAGE BREAK -----\n\n".join(pages)
-            corpus[name] = {"pages": pages, "text": joined, "page_count": len(pages)}
-            chars_total = len(joined)
-            rows.append({
-                "file": name,
-                "pages": len(pages),
-                "chars_total": chars_total,
-                "avg_chars_per_page": int(chars_total / len(pages)) if pages else 0,
-                "status": "ok",
-                "error": ""
-            })
-        except PDFReadError as e:
-            rows.append({
-                "file": name,
-                "pages": 0,
-                "chars_total": 0,
-                "avg_chars_per_page": 0,
-                "status": "error",
-                "error": str(e)
-            })
+    paths = sorted(glob.glob(pattern))
+    workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    if workers > 1:
+        # ex.map yields in input order, so the corpus keeps the sorted file order.
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(_ingest_one, paths))
+    else:
+        results = [_ingest_one(path) for path in paths]
+
+    for name, entry, row in results:
+        if entry is not None:
+            corpus[name] = entry
+        rows.append(row)
     return corpus, rows
 
 def format_report(rows: List[Dict[str, Any]]) -> str:
@@ -1,54 +1,58 @@
 from __future__ import annotations
-import time
+import time, asyncio
+from collections import ChainMap
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 import engine
 from io_utils import write_metadata_header_md, write_citations_list
 
-def _build_review_corpus_text(items: List[Dict[str,Any]]) -> str:
+_BLOCK = (
+    "[{i}] {fn}\n"
+    "- Main idea: {main_idea}\n"
+    "- Objective: {objective}\n"
+    "- Design: {design}\n"
+    "- Methods: {methods}\n"
+    "- Results: {results}\n"
+    "- Main findings: {main_findings}"
+)
+_DEFAULTS = {k: "Not reported" for k in ("main_idea","objective","design","methods","results","main_findings")}
+
+def _build_review_corpus_text(items: List[Dict[str,Any]], indices: List[int] | None = None) -> str:
     """
     Build a consistent, label-rich corpus for Phase 2.
     Each block starts with an index and a label (the filename),
-    followed by the six Phase 1 fields.
+    followed by the six Phase 1 fields. `indices` overrides the
+    default 1..N numbering (used when summarizing a subset).
     """
-    blocks = []
-    for i, it in enumerate(items, 1):
-        s = it["summary"]; fn = it["file"]
-        blocks.append(
-            f"[{i}] {fn}\n"
-            f"- Main idea: {s.get('main_idea','')}\n"
-            f"- Objective: {s.get('objective','')}\n"
-            f"- Design: {s.get('design','')}\n"
-            f"- Methods: {s.get('methods','')}\n"
-            f"- Results: {s.get('results','')}\n"
-            f"- Main findings: {s.get('main_findings','')}"
-        )
-    return "\n\n".join(blocks)
+    return "\n\n".join(
+        _BLOCK.format_map(ChainMap({"i": i, "fn": it["file"]}, it["summary"], _DEFAULTS))
+        for i, it in zip(indices or range(1, len(items) + 1), items)
+    )
 
-def run_review(
-    items: List[Dict[str,Any]],
+def _write_review(
+    n_items: int,
+    out: Dict[str,str]|None,
+    usage: Dict[str,int],
+    start: float,
     out_review_md: str,
     out_citations_md: str|None,
-    context: str,
     mode: str,
     cfg: Dict[str,Any],
 ) -> Dict[str,Any]:
-
-    start = time.time()
-    text = _build_review_corpus_text(items)
-
-    used_mode, out, usage = engine.summarize_text(text, context, mode, cfg)
     lit = out.get("literature_review") if out else ""
     cits = out.get("contextual_citations") if out else ""
 
+    engine.log_cache_ratio("REV ", usage)
+
     runtime = round(time.time() - start, 2)
     meta = {
-        "Items": len(items),
+        "Items": n_items,
         "Model": cfg["model"],
         "Mode": mode,
         "Prompt tokens": usage.get("prompt_tokens",0),
         "Completion tokens": usage.get("completion_tokens",0),
         "Total tokens": usage.get("total_tokens",0),
+        "Cached prompt tokens": usage.get("cached_tokens",0),
         "Runtime (s)": runtime,
     }
 
@@ -68,3 +72,148 @@ def run_review(
         write_citations_list(Path(out_citations_md), cits.splitlines() if cits else [])
 
     return {"meta": meta, "usage": usage}
+
+def run_review(
+    items: List[Dict[str,Any]],
+    out_review_md: str,
+    out_citations_md: str|None,
+    context: str,
+    mode: str,
+    cfg: Dict[str,Any],
+) -> Dict[str,Any]:
+    return asyncio.run(arun_review(items, out_review_md, out_citations_md, context, mode, cfg))
+
+def _cluster_items(vectors: List[List[float]], n_clusters: int) -> List[List[int]]:
+    # scikit-learn is only needed when clustering is enabled.
+    from sklearn.cluster import AgglomerativeClustering
+    labels = AgglomerativeClustering(n_clusters=n_clusters, metric="cosine", linkage="average").fit_predict(vectors)
+    groups: Dict[int, List[int]] = {}
+    for i, label in enumerate(labels):
+        groups.setdefault(int(label), []).append(i)
+    return list(groups.values())  # clusters in order of their first paper
+
+async def _acluster(items: List[Dict[str,Any]], cfg: Dict[str,Any]) -> Tuple[List[List[int]], Dict[str,int]]:
+    """Embed each paper's summary block and group the papers into cfg["clusters"] topical clusters."""
+    vectors, usage = await engine.aembed_texts([_build_review_corpus_text([it]) for it in items], cfg)
+    groups = _cluster_items(vectors, min(cfg["clusters"], len(items)))
+    print(f"[REV ] {len(items)} summaries in {len(groups)} clusters")
+    return groups, usage
+
+async def _areview_clustered(
+    items: List[Dict[str,Any]],
+    groups: List[List[int]],
+    context: str,
+    cfg: Dict[str,Any],
+) -> Tuple[Dict[str,str]|None, Dict[str,int]]:
+    """
+    Chunked review where each map request holds one cluster of similar papers
+    (by embedding), so partials are topically coherent before they are reduced.
+    """
+    usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+
+    async def map_cluster(idxs: List[int]) -> Tuple[Dict[str,str]|None, Dict[str,int]]:
+        text = _build_review_corpus_text([items[i] for i in idxs], [i + 1 for i in idxs])
+        try:
+            return await engine.achunked_map_reduce(text, context, cfg)
+        except Exception as e:
+            engine.log_error("_areview_clustered(map)", e)
+            return None, {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+
+    mapped = await asyncio.gather(*(map_cluster(g) for g in groups))
+    for _, u in mapped:
+        usage = engine.add_usage(usage, u)
+    parts = [p for p, _ in mapped if p]
+    if not parts:
+        return None, usage
+    out, uR = await engine.areduce_tree(parts, context, cfg)
+    return out, engine.add_usage(usage, uR)
+
+async def arun_review(
+    items: List[Dict[str,Any]],
+    out_review_md: str,
+    out_citations_md: str|None,
+    context: str,
+    mode: str,
+    cfg: Dict[str,Any],
+) -> Dict[str,Any]:
+
+    start = time.time()
+    text = _build_review_corpus_text(items)
+
+    # With clustering on, whenever the corpus has to be chunked, chunk it by topic.
+    clustered = cfg.get("clusters", 0) > 1 and len(items) > 1 and (
+        mode == "always" or (mode == "auto" and not engine.fits_single_pass(text, cfg))
+    )
+    if clustered:
+        try:
+            groups, embed_usage = await _acluster(items, cfg)
+        except Exception as e:
+            # Embedding/clustering is an optimization; fall back to the plain path.
+            engine.log_error("arun_review(clustering)", e)
+            clustered = False
+    if clustered:
+        out, usage = await _areview_clustered(items, groups, context, cfg)
+        usage = engine.add_usage(embed_usage, usage)
+    else:
+        used_mode, out, usage = await engine.asummarize_text(text, context, mode, cfg)
+    return _write_review(len(items), out, usage, start, out_review_md, out_citations_md, mode, cfg)
+
+async def arun_review_stream(
+    source: asyncio.Queue,
+    out_review_md: str,
+    out_citations_md: str|None,
+    context: str,
+    mode: str,
+    cfg: Dict[str,Any],
+) -> Dict[str,Any]:
+    """
+    Phase 2 fed by a running Phase 1: consumes (corpus index, item) pairs until None.
+    In mode "always" the map step starts on every cfg["stream_group_size"] summaries
+    as soon as they land, and the partials are reduced once Phase 1 is done. Other
+    modes (and clustering, which needs every summary) wait for the whole corpus.
+    Papers keep their corpus index, so citations match the Phase 1 order either way.
+    """
+    start = time.time()
+    k = cfg.get("stream_group_size", 10)
+    received: List[Tuple[int, Dict[str,Any]]] = []
+    group: List[Tuple[int, Dict[str,Any]]] = []
+    maps: List[asyncio.Task] = []
+    streaming = mode == "always" and cfg.get("clusters", 0) <= 1
+
+    async def map_group(entries: List[Tuple[int, Dict[str,Any]]]) -> Tuple[Dict[str,str]|None, Dict[str,int]]:
+        entries = sorted(entries, key=lambda e: e[0])
+        text = _build_review_corpus_text([it for _, it in entries], [i + 1 for i, _ in entries])
+        try:
+            return await engine.achunked_map_reduce(text, context, cfg)
+        except Exception as e:
+            engine.log_error("arun_review_stream(map)", e)
+            return None, {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+
+    while True:
+        entry = await source.get()
+        if entry is None:
+            break
+        received.append(entry)
+        if streaming:
+            group.append(entry)
+            if len(group) >= k:
+                print(f"[REV ] mapping {len(group)} summaries ({len(received)} received)")
+                maps.append(asyncio.create_task(map_group(group)))
+                group = []
+
+    if not streaming:
+        items = [it for _, it in sorted(received, key=lambda e: e[0])]
+        return await arun_review(items, out_review_md, out_citations_md, context, mode, cfg)
+
+    if group:
+        maps.append(asyncio.create_task(map_group(group)))
+    mapped = await asyncio.gather(*maps)
+    usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+    for _, u in mapped:
+        usage = engine.add_usage(usage, u)
+    parts = [p for p, _ in mapped if p]
+    out = None
+    if parts:
+        out, uR = await engine.areduce_tree(parts, context, cfg)
+        usage = engine.add_usage(usage, uR)
+    return _write_review(len(received), out, usage, start, out_review_md, out_citations_md, mode, cfg)
@@ -1,19 +1,127 @@
 from __future__ import annotations
-import json, time, re
+import time, asyncio
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable
+import orjson
 from pdf_ingest import load_corpus
 import engine
-from io_utils import write_metadata_header_md, format_summary_section
+from io_utils import write_metadata_header_md, rewrite_metadata_header_md, format_summary_section
 
-REF_HEAD_RE = re.compile(r'^\s*(references|bibliography|literature)\b', re.I | re.M)
-PAGE_BREAK = "\n\n----- PAGE BREAK -----\n\n"
+# Called with (paper index, result) as soon as each paper finishes; results are only
+# delivered this way, so nothing holds the whole corpus's summaries.
+OnResult = Callable[[int, Any], None]
 
-def _truncate_at_references(pages: List[str]) -> List[str]:
-    for idx, p in enumerate(pages):
-        if REF_HEAD_RE.search(p):
-            return pages[:idx]
-    return pages
+# Header values are padded to this width so the final counts can overwrite the
+# placeholders in place once the run is done.
+_HEADER_WIDTH = 24
+
+def _review_item(name: str, res: Any, schema_keys: List[str]) -> Dict[str,Any]:
+    summary = None if isinstance(res, BaseException) else res[1]
+    return {"file": name, "summary": summary or {k: "Not reported" for k in schema_keys}}
+
+async def _summarize_all(
+    names: List[str],
+    texts: List[str],
+    mode: str,
+    cfg: Dict[str,Any],
+    pack_size: int,
+    on_result: OnResult,
+) -> Dict[str,int]:
+    # Papers are independent and the work is I/O-bound on the API, so run them all
+    # concurrently; engine caps in-flight requests at cfg["num_concurrent"].
+    # With pack_size > 1, small papers are packed K per request; whatever the packed
+    # reply misses falls back to a normal per-paper request. The packed requests'
+    # usage is returned separately so per-paper results stay (mode, summary, usage).
+    pack_usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+    no_usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+
+    async def one(i: int) -> None:
+        try:
+            res = await engine.asummarize_text(texts[i], "", mode, cfg)
+        except Exception as e:
+            res = e
+        on_result(i, res)
+
+    async def many(idxs: List[int]) -> None:
+        nonlocal pack_usage
+        got, u = await engine.asummarize_many([(names[i], texts[i]) for i in idxs], cfg)
+        pack_usage = engine.add_usage(pack_usage, u)
+        missing = []
+        for i in idxs:
+            if names[i] in got:
+                on_result(i, ("packed", got[names[i]], no_usage))
+            else:
+                missing.append(i)
+        if missing:
+            print(f"[SUM ] packed reply had {len(idxs) - len(missing)}/{len(idxs)}; retrying the rest one by one")
+        await asyncio.gather(*(one(i) for i in missing))
+
+    packable: List[int] = []
+    if pack_size > 1 and mode != "always":
+        max_tokens = cfg.get("pack_max_tokens", 8000)
+        packable = [i for i, t in enumerate(texts) if engine.count_tokens(t, cfg["model"]) <= max_tokens]
+    groups = [packable[k:k + pack_size] for k in range(0, len(packable), pack_size)]
+    packed = set(packable)
+    singles = [i for i in range(len(texts)) if i not in packed]
+    singles += [g[0] for g in groups if len(g) == 1]
+    await asyncio.gather(
+        *(many(g) for g in groups if len(g) > 1),
+        *(one(i) for i in singles),
+    )
+    return pack_usage
+
+async def _summarize_via_batch_api(
+    names: List[str],
+    texts: List[str],
+    cfg: Dict[str,Any],
+    on_result: OnResult,
+) -> Dict[str,int]:
+    # Offline path: one Batch API job for the papers that fit a single-pass request.
+    # Papers known to be too long go straight to the live chunked path (no point
+    # waiting up to 24h for a request that must fail); papers the batch could not
+    # finish (errors, truncation, expiry) go through the live "auto" path.
+    no_usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+
+    async def live(idxs: List[int], live_mode: str) -> Dict[str,int]:
+        if not idxs:
+            return no_usage
+        return await _summarize_all(
+            [names[i] for i in idxs], [texts[i] for i in idxs], live_mode, cfg, 1,
+            lambda j, r: on_result(idxs[j], r),
+        )
+
+    async def via_batch(idxs: List[int]) -> Dict[str,int]:
+        if not idxs:
+            return no_usage
+        items = [(names[i], texts[i]) for i in idxs]
+        # cfg["batch_id"] resumes a job submitted by an earlier run instead of paying for a new one.
+        batch_id, done = cfg.get("batch_id"), {}
+        if batch_id:
+            print(f"[SUM ] resuming batch {batch_id}")
+        else:
+            batch_id, done = await engine.asubmit_batch(items, cfg)
+        if batch_id:
+            done.update(await engine.await_batch(batch_id, items, cfg))
+        batch_usage = no_usage
+        retry = []
+        for i in idxs:
+            summary, status, usage = done.get(names[i], (None, "missing", {}))
+            batch_usage = engine.add_usage(batch_usage, usage)
+            if summary:
+                on_result(i, ("batch-api", summary, no_usage))
+            else:
+                print(f"[SUM ] {names[i]}  batch status={status}; retrying live")
+                retry.append(i)
+        return engine.add_usage(batch_usage, await live(retry, "auto"))
+
+    fits, too_big = [], []
+    for i, t in enumerate(texts):
+        cleaned = engine.clean_text(t, cfg.get("drop_refs_after_page"), cfg.get("cut_at_references", True))
+        (fits if engine.fits_single_pass(cleaned, cfg) else too_big).append(i)
+    if too_big:
+        print(f"[SUM ] {len(too_big)} paper(s) too long for single-pass; summarizing them live (chunked)")
+    u_batch, u_live = await asyncio.gather(via_batch(fits), live(too_big, "always"))
+    return engine.add_usage(u_batch, u_live)
 
 def run_summaries(
     input_pattern: str,
@@ -21,62 +129,133 @@ def run_summaries(
     out_jsonl: str,
     mode: str,
     cfg: Dict[str,Any],
+    pack_size: int = 1,
+) -> Dict[str,Any]:
+    return asyncio.run(arun_summaries(input_pattern, out_md, out_jsonl, mode, cfg, pack_size))
+
+async def arun_summaries(
+    input_pattern: str,
+    out_md: str,
+    out_jsonl: str,
+    mode: str,
+    cfg: Dict[str,Any],
+    pack_size: int = 1,
+    sink: asyncio.Queue | None = None,
+) -> Dict[str,Any]:
+    """
+    Async Phase 1. If `sink` is given, each paper's review item is put on it as
+    (corpus index, {"file", "summary"}) the moment that paper finishes, followed by
+    a final None, so Phase 2 can start before the whole corpus is done.
+    """
+    try:
+        return await _arun_summaries(input_pattern, out_md, out_jsonl, mode, cfg, pack_size, sink)
+    finally:
+        if sink is not None:
+            sink.put_nowait(None)
+
+async def _arun_summaries(
+    input_pattern: str,
+    out_md: str,
+    out_jsonl: str,
+    mode: str,
+    cfg: Dict[str,Any],
+    pack_size: int,
+    sink: asyncio.Queue | None,
 ) -> Dict[str,Any]:
 
     start = time.time()
     corpus, scan_rows = load_corpus(input_pattern)
     pages_total = sum(v["page_count"] for v in corpus.values())
-    chars_total = sum(len(v["text"]) for v in corpus.values())
+    chars_total = sum(r["chars_total"] for r in scan_rows if r["status"] == "ok")
 
     out_md_p = Path(out_md)
     out_jsonl_p = Path(out_jsonl)
     out_jsonl_p.parent.mkdir(parents=True, exist_ok=True)
 
     token_usage = {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
-    sections: List[str] = []
     items_for_review: List[Dict[str,Any]] = []
 
-    processed=success=0
-    with out_jsonl_p.open("w", encoding="utf-8") as jf:
-        for name, item in corpus.items():
-            processed += 1
-            pages = _truncate_at_references(item["pages"])
-            # Build annotated text with explicit page anchors like <<p=5>> before each page
-            annotated = []
-            for i, page in enumerate(pages, 1):
-                annotated.append(f"<<p={i}>>\n{page}")
-            text = "\n\n".join(annotated)
-
-            print(f"[SUM ] {name}  pages={len(pages)}  mode={mode}  chars={len(text)}")
-            used_mode, summary, usage = engine.summarize_text(text, "", mode, cfg)
-            token_usage = engine.add_usage(token_usage, usage)
+    # References are cut here, on the page list; the engine must not scan the joined text again.
+    cut_refs = cfg.get("cut_at_references", True)
+    call_cfg = {**cfg, "cut_at_references": False}
 
+    names: List[str] = []
+    texts: List[str] = []
+    for name, item in corpus.items():
+        pages = engine.truncate_pages_at_references(item["pages"]) if cut_refs else item["pages"]
+        # Build annotated text with explicit page anchors like <<p=5>> before each page
+        text = "\n\n".join(f"<<p={i}>>\n{page}" for i, page in enumerate(pages, 1))
+
+        print(f"[SUM ] {name}  pages={len(pages)}  mode={mode}  chars={len(text)}")
+        names.append(name)
+        texts.append(text)
+
+    def make_meta(processed: Any, success: Any, usage: Dict[str,Any], runtime: Any) -> Dict[str,Any]:
+        return {
+            "Files processed": processed,
+            "Successful": success,
+            "Total pages": pages_total,
+            "Total chars": chars_total,
+            "Model": cfg["model"],
+            "Mode": mode,
+            "Prompt tokens": usage["prompt_tokens"],
+            "Completion tokens": usage["completion_tokens"],
+            "Total tokens": usage["total_tokens"],
+            "Cached prompt tokens": usage.get("cached_tokens", 0),
+            "Runtime (s)": runtime,
+        }
+
+    # Header first with placeholder counts; each paper is then appended (Markdown and
+    # JSONL) as soon as it and every paper before it are done, so the files keep
+    # corpus order and a crash keeps everything finished so far.
+    pending = {k: "pending" for k in ("prompt_tokens","completion_tokens","total_tokens","cached_tokens")}
+    header_len = write_metadata_header_md(
+        out_md_p, "Research Paper Summaries", make_meta("pending", "pending", pending, "pending"), _HEADER_WIDTH,
+    )
+    success = 0
+    ready: Dict[int, Any] = {}
+    next_i = 0
+
+    with out_jsonl_p.open("wb") as jf, out_md_p.open("a", encoding="utf-8") as mf:
+
+        def write_one(i: int, res: Any) -> None:
+            nonlocal token_usage, success
+            name = names[i]
+            summary = None
+            if isinstance(res, BaseException):
+                engine.log_error(f"run_summaries({name})", res)
+            else:
+                _, summary, usage = res
+                token_usage = engine.add_usage(token_usage, usage)
+            if i:
+                mf.write("\n")
             if summary:
                 success += 1
-                jf.write(json.dumps({"file": name, "summary": summary}, ensure_ascii=False) + "\n")
-                sections.append(format_summary_section(name, summary, cfg["schema_keys"]))
-                items_for_review.append({"file": name, "summary": summary})
+                jf.write(orjson.dumps({"file": name, "summary": summary}, option=orjson.OPT_APPEND_NEWLINE))
+                mf.write(format_summary_section(name, summary, cfg["schema_keys"]))
             else:
-                jf.write(json.dumps({"file": name, "summary": None}, ensure_ascii=False) + "\n")
-                sections.append(f"## {name}\n\n**Error:** model returned no summary.\n")
-                items_for_review.append({"file": name, "summary": {k: "Not reported" for k in cfg["schema_keys"]}})
-
-    runtime = round(time.time() - start, 2)
-    meta = {
-        "Files processed": processed,
-        "Successful": success,
-        "Total pages": pages_total,
-        "Total chars": chars_total,
-        "Model": cfg["model"],
-        "Mode": mode,
-        "Prompt tokens": token_usage["prompt_tokens"],
-        "Completion tokens": token_usage["completion_tokens"],
-        "Total tokens": token_usage["total_tokens"],
-        "Runtime (s)": runtime,
-    }
-
-    write_metadata_header_md(out_md_p, "Research Paper Summaries", meta)
-    with out_md_p.open("a", encoding="utf-8") as f:
-        f.write("\n".join(sections))
+                jf.write(orjson.dumps({"file": name, "summary": None}, option=orjson.OPT_APPEND_NEWLINE))
+                mf.write(f"## {name}\n\n**Error:** model returned no summary.\n")
+            items_for_review.append(_review_item(name, res, cfg["schema_keys"]))
+
+        def on_result(i: int, res: Any) -> None:
+            nonlocal next_i
+            if sink is not None:
+                sink.put_nowait((i, _review_item(names[i], res, cfg["schema_keys"])))
+            ready[i] = res
+            while next_i in ready:
+                write_one(next_i, ready.pop(next_i))
+                next_i += 1
+            jf.flush(); mf.flush()
+
+        if mode == "batch":
+            shared_usage = await _summarize_via_batch_api(names, texts, call_cfg, on_result)
+        else:
+            shared_usage = await _summarize_all(names, texts, mode, call_cfg, pack_size, on_result)
+    token_usage = engine.add_usage(token_usage, shared_usage)
+    engine.log_cache_ratio("SUM ", token_usage)
+
+    meta = make_meta(next_i, success, token_usage, round(time.time() - start, 2))
+    rewrite_metadata_header_md(out_md_p, "Research Paper Summaries", meta, _HEADER_WIDTH, header_len)
 
     return {"meta": meta, "items": items_for_review, "usage": token_usage}
@@ -1,10 +1,11 @@
 from __future__ import annotations
-import json
+import asyncio
+import orjson
 from pathlib import Path
 from typing import Dict, Any, List
 
-from phase_summaries import run_summaries
-from phase_review import run_review
+from phase_summaries import run_summaries, arun_summaries
+from phase_review import run_review, arun_review_stream
 
 # ===================== EDIT ONLY THIS CONFIG =====================
 CONFIG: Dict[str, Any] = {
@@ -21,14 +22,23 @@ CONFIG: Dict[str, Any] = {
 
     # Phase 1 (per-paper summaries)
     "phase1": {
-        "mode": "auto",  # "auto" | "always" | "never"
+        "mode": "auto",  # "auto" | "always" | "never" | "batch" (OpenAI Batch API: 50% cheaper, up to 24h)
+        "pack_size": 1,  # >1 packs up to K small papers into one request (saves requests/min)
         "cfg": {
             "model": "gpt-5",
             "schema_keys": ["main_idea","objective","design","methods","results","main_findings"],
             "drop_refs_after_page": None,     # disable fixed-page truncation
             "cut_at_references": True,        # prefer semantic cut by heading
-            "binary_overlap": 500,
+            "binary_overlap": 500,            # tokens shared by both halves when a text is split
+            "single_pass_max_tokens": None,   # None = model context minus "reserve"; longer texts skip single-pass in "auto"
+            "reserve": 4096,                  # tokens kept free for the prompt template and the reply
             "temperature": 1,               # reduce fluff
+            "num_concurrent": 8,            # max API requests in flight at once (shared by both phases)
+            "max_requests_per_minute": 500,   # set to your account's limits for this model
+            "max_tokens_per_minute": 500000,
+            "pack_max_tokens": 8000,        # only papers up to this size are packed together
+            "batch_poll_seconds": 30,       # status polling interval for mode="batch"
+            "batch_id": None,               # mode="batch": id of an earlier job to resume instead of submitting
             "prompts": {
                 "system": (
                     "You are an expert scientific summarizer.\\n"
@@ -53,11 +63,19 @@ CONFIG: Dict[str, Any] = {
                     "CHUNK:\\n{chunk}"
                 ),
                 "reduce": (
-                    "You are given multiple partial JSON summaries from chunks of the SAME paper.\\n"
+                    "You are given multiple partial summaries from chunks of the SAME paper.\\n"
+                    "Each partial lists its fields as 'key: value' lines; partials are separated by a line containing only ---.\\n"
                     "Merge into ONE final JSON with the exact keys. Remove duplicates, keep the most specific bullets,\\n"
                     "and preserve page anchors. If a field is never reported, write 'Not reported'.\\n\\n"
                     "PARTIALS:\\n{partials}"
                 ),
+                # Appended to the system prompt when several papers share one request (pack_size > 1)
+                "pack": (
+                    "PACKED MODE: the input contains several papers, each starting with a [[FILE=<name>]] tag.\\n"
+                    "Summarize EACH paper separately using the rules above; page anchors refer to that paper's own <<p=#>> markers.\\n"
+                    'Instead of a single object, return {"papers": [{"file": "<name>", "summary": {...the object above...}}, ...]}\\n'
+                    "with exactly one entry per FILE tag."
+                ),
             },
         },
     },
@@ -65,7 +83,7 @@ CONFIG: Dict[str, Any] = {
     # Phase 2 (synthesis + contextual citations)
     "phase2": {
         "context": "",
-        "mode": "auto",
+        "mode": "auto",  # with run="both", "always" starts mapping summaries while Phase 1 is still running
         "cfg": {
             "model": "gpt-5",
             "schema_keys": ["literature_review","contextual_citations"],
@@ -73,6 +91,11 @@ CONFIG: Dict[str, Any] = {
             "cut_at_references": False,
             "binary_overlap": 500,
             "temperature": 1,
+            "stream_group_size": 10,        # summaries per map request when streaming from Phase 1
+            "clusters": 0,                  # >1: when chunking, group papers into N topical clusters (embeddings)
+            "embedding_model": "text-embedding-3-small",
+            "max_requests_per_minute": 500,
+            "max_tokens_per_minute": 500000,
             "prompts": {
                 "system": (
                     "You are an expert reviewer.\\n"
@@ -98,7 +121,8 @@ CONFIG: Dict[str, Any] = {
                 ),
                 "reduce": (
                     'Context: "{context}"\\n\\n'
-                    "You are given multiple partial JSON outputs for the same task.\\n"
+                    "You are given multiple partial outputs for the same task.\\n"
+                    "Each partial lists its fields as 'key: value' lines; partials are separated by a line containing only ---.\\n"
                     "Merge into ONE final JSON with the exact keys. Concatenate literature_review coherently;\\n"
                     "deduplicate contextual_citations (newline-separated list).\\n\\n"
                     "PARTIALS:\\n{partials}"
@@ -109,6 +133,28 @@ CONFIG: Dict[str, Any] = {
 }
 # =================== END EDITABLE CONFIG ===================
 
+async def _run_both(outs: Dict[str,str]) -> None:
+    queue: asyncio.Queue = asyncio.Queue()
+    await asyncio.gather(
+        arun_summaries(
+            input_pattern = CONFIG["input_pattern"],
+            out_md        = outs["summaries_md"],
+            out_jsonl     = outs["summaries_jsonl"],
+            mode          = CONFIG["phase1"]["mode"],
+            cfg           = CONFIG["phase1"]["cfg"],
+            pack_size     = CONFIG["phase1"]["pack_size"],
+            sink          = queue,
+        ),
+        arun_review_stream(
+            source           = queue,
+            out_review_md    = outs["review_md"],
+            out_citations_md = outs["citations_md"],
+            context          = CONFIG["phase2"]["context"],
+            mode             = CONFIG["phase2"]["mode"],
+            cfg              = CONFIG["phase2"]["cfg"],
+        ),
+    )
+
 def main() -> None:
     outs = CONFIG["outputs"]
     if CONFIG["run"] == "phase1":
@@ -118,6 +164,7 @@ def main() -> None:
             out_jsonl     = outs["summaries_jsonl"],
             mode          = CONFIG["phase1"]["mode"],
             cfg           = CONFIG["phase1"]["cfg"],
+            pack_size     = CONFIG["phase1"]["pack_size"],
         )
         print("[PIPE] Done (phase1)")
         return
@@ -125,9 +172,9 @@ def main() -> None:
     if CONFIG["run"] == "phase2":
         # Load items from Phase 1 output
         items: List[Dict[str,Any]] = []
-        with Path(outs["summaries_jsonl"]).open("r", encoding="utf-8") as f:
+        with Path(outs["summaries_jsonl"]).open("rb") as f:
             for line in f:
-                row = json.loads(line)
+                row = orjson.loads(line)
                 if row.get("summary"): items.append(row)
         _ = run_review(
             items            = items,
@@ -140,22 +187,8 @@ def main() -> None:
         print("[PIPE] Done (phase2)")
         return
 
-    # both
-    s = run_summaries(
-        input_pattern = CONFIG["input_pattern"],
-        out_md        = outs["summaries_md"],
-        out_jsonl     = outs["summaries_jsonl"],
-        mode          = CONFIG["phase1"]["mode"],
-        cfg           = CONFIG["phase1"]["cfg"],
-    )
-    _ = run_review(
-        items            = s["items"],
-        out_review_md    = outs["review_md"],
-        out_citations_md = outs["citations_md"],
-        context          = CONFIG["phase2"]["context"],
-        mode             = CONFIG["phase2"]["mode"],
-        cfg              = CONFIG["phase2"]["cfg"],
-    )
+    # both: Phase 2 consumes summaries as Phase 1 produces them
+    asyncio.run(_run_both(outs))
     print("[PIPE] Done (both phases)")
 
 if __name__ == "__main__":